@@ -1,8 +1,10 @@
 import streamlit as st
-import uuid
-from dataclasses import dataclass
-from typing import Dict, Optional
-import re
+import secrets
+import functools
+import html
+from array import array
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional, Tuple
 
 # Configure page
 st.set_page_config(
@@ -13,7 +15,10 @@ st.set_page_config(
 )
 
 # Custom CSS for hospital theme
-st.markdown("""
+@st.cache_data
+def _theme_css() -> str:
+    """Return the hospital theme stylesheet"""
+    return """
 <style>
     .main-header {
         background: linear-gradient(90deg, #2E8B57, #20B2AA);
@@ -66,7 +71,9 @@ st.markdown("""
         background: #F0F8FF;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(_theme_css(), unsafe_allow_html=True)
 
 @dataclass
 class Patient:
@@ -77,115 +84,200 @@ class Patient:
     gender: str
     phone: str
     address: str
-    
-    def to_dict(self) -> Dict:
-        """Convert patient object to dictionary"""
-        return {
-            'hospital_id': self.hospital_id,
-            'name': self.name,
-            'age': self.age,
-            'gender': self.gender,
-            'phone': self.phone,
-            'address': self.address
-        }
 
 class PatientDatabase:
-    """In-memory patient database - easily replaceable with SQLite/PostgreSQL"""
+    """In-memory patient database - easily replaceable with SQLite/PostgreSQL
+    
+    Patients are stored column-wise: one list per Patient field (ages in a
+    compact int16 array) plus phone -> row and hospital ID -> row indexes.
+    Rows are append-only, so row order is registration order.
+    """
     
     def __init__(self):
-        if 'patients_db' not in st.session_state:
-            st.session_state.patients_db = {}
+        self.init_session()
+    
+    def init_session(self):
+        """Create this session's storage if it does not exist yet"""
+        if 'patient_cols' not in st.session_state:
+            st.session_state.patient_cols = {
+                f.name: array('h') if f.name == 'age' else [] for f in fields(Patient)
+            }
+        if 'patients_by_phone' not in st.session_state:
+            st.session_state.patients_by_phone = {}
+        if 'patients_by_hid' not in st.session_state:
+            st.session_state.patients_by_hid = {}
+    
+    def _row(self, row: int) -> Dict:
+        """Assemble one patient record from the columns"""
+        return {name: col[row] for name, col in st.session_state.patient_cols.items()}
     
     def save_patient(self, patient: Patient) -> bool:
-        """Save patient to database"""
-        try:
-            st.session_state.patients_db[patient.phone] = patient.to_dict()
-            return True
-        except Exception as e:
-            st.error(f"Database error: {str(e)}")
+        """Save patient to database; False if the phone or hospital ID is already taken"""
+        if (patient.phone in st.session_state.patients_by_phone
+                or patient.hospital_id in st.session_state.patients_by_hid):
             return False
+        cols = st.session_state.patient_cols
+        row = len(cols['phone'])
+        for name, col in cols.items():
+            col.append(getattr(patient, name))
+        st.session_state.patients_by_phone[patient.phone] = row
+        st.session_state.patients_by_hid[patient.hospital_id] = row
+        return True
     
     def get_patient_by_phone(self, phone: str) -> Optional[Dict]:
         """Retrieve patient by phone number"""
-        return st.session_state.patients_db.get(phone)
+        row = st.session_state.patients_by_phone.get(phone)
+        return self._row(row) if row is not None else None
+    
+    def has_phone(self, phone: str) -> bool:
+        """Check whether a phone number is already registered"""
+        return phone in st.session_state.patients_by_phone
     
     def get_patient_by_id(self, hospital_id: str) -> Optional[Dict]:
         """Retrieve patient by hospital ID"""
-        for patient_data in st.session_state.patients_db.values():
-            if patient_data['hospital_id'] == hospital_id:
-                return patient_data
-        return None
+        row = st.session_state.patients_by_hid.get(hospital_id)
+        return self._row(row) if row is not None else None
     
     def update_patient(self, phone: str, updated_data: Dict) -> bool:
-        """Update existing patient data"""
-        try:
-            if phone in st.session_state.patients_db:
-                st.session_state.patients_db[phone].update(updated_data)
-                return True
+        """Update existing patient data, re-indexing a changed phone or hospital ID"""
+        row = st.session_state.patients_by_phone.get(phone)
+        if row is None:
+            return False
+        cols = st.session_state.patient_cols
+        unknown = updated_data.keys() - cols.keys()
+        if unknown:
+            raise KeyError(f"Unknown patient fields: {', '.join(sorted(unknown))}")
+        new_phone = updated_data.get('phone', phone)
+        old_hid = cols['hospital_id'][row]
+        new_hid = updated_data.get('hospital_id', old_hid)
+        # Refuse to take over another patient's phone or hospital ID
+        if st.session_state.patients_by_phone.get(new_phone, row) != row:
             return False
-        except Exception as e:
-            st.error(f"Update error: {str(e)}")
+        if st.session_state.patients_by_hid.get(new_hid, row) != row:
             return False
+        if new_phone != phone:
+            del st.session_state.patients_by_phone[phone]
+            st.session_state.patients_by_phone[new_phone] = row
+        if new_hid != old_hid:
+            del st.session_state.patients_by_hid[old_hid]
+            st.session_state.patients_by_hid[new_hid] = row
+        for name, value in updated_data.items():
+            cols[name][row] = value
+        return True
+    
+    def get_recent_patients(self, limit: int = 3) -> List[Dict]:
+        """Get the most recently registered patients, newest first"""
+        total = self.get_total_patients()
+        return [self._row(row) for row in range(total - 1, max(total - limit, 0) - 1, -1)]
     
     def get_total_patients(self) -> int:
         """Get total number of registered patients"""
-        return len(st.session_state.patients_db)
+        return len(st.session_state.patient_cols['phone'])
+
+# Strips dashes and spaces from phone input in a single pass
+_TRANS = str.maketrans('', '', '- ')
 
+_GENDERS = ("Male", "Female", "Other")
+_GENDER_IDX = {g: i for i, g in enumerate(_GENDERS)}
+_GENDERS_WITH_BLANK = ("",) + _GENDERS
+
+_TABS = ("👤 Patient Registration", "🔍 Patient Lookup & Update")
+_SEARCH_MODES = ("Phone Number", "Hospital ID")
+
+_CARD_TMPL = """
+        <div class="patient-card">
+            <h4>📋 Patient Details</h4>
+            <p><strong>Hospital ID:</strong> {hospital_id}</p>
+            <p><strong>Name:</strong> {name}</p>
+            <p><strong>Phone:</strong> {phone}</p>
+            <p><em>Please save the Hospital ID for future reference</em></p>
+        </div>
+        """
+
+@st.cache_resource
+def _shared_db() -> PatientDatabase:
+    """Process-wide database handle; patient data itself lives in session state"""
+    return PatientDatabase()
+
+def get_db() -> PatientDatabase:
+    """Return the shared database handle, initialised for the current session"""
+    db = _shared_db()
+    db.init_session()
+    return db
+
+@functools.lru_cache(maxsize=1024)
+def normalize_phone(raw: str) -> str:
+    """Strip dashes and spaces from a phone number"""
+    return raw.translate(_TRANS)
+
+@functools.lru_cache(maxsize=1024)
 def validate_phone(phone: str) -> bool:
     """Validate phone number format"""
     # Simple validation for 10-digit phone numbers
-    pattern = r'^\d{10}$'
-    return bool(re.match(pattern, phone.replace('-', '').replace(' ', '')))
+    s = normalize_phone(phone)
+    return len(s) == 10 and s.isdecimal()
 
 def generate_hospital_id() -> str:
     """Generate unique hospital ID"""
-    return f"HSP-{str(uuid.uuid4())[:8].upper()}"
+    return f"HSP-{secrets.token_hex(4).upper()}"
+
+def _patient_fields(key_prefix: str, d: Optional[Dict] = None) -> Tuple[str, int, str, str, str]:
+    """Render the patient input fields; pre-filled from d when editing an existing patient"""
+    editing = d is not None
+    required = "" if editing else " *"
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        name = st.text_input(f"Full Name{required}", value=d['name'] if editing else "",
+                             placeholder="Enter patient's full name", key=f"{key_prefix}_name")
+        age = st.number_input(f"Age{required}", min_value=0, max_value=150,
+                              value=d['age'] if editing else 0, key=f"{key_prefix}_age")
+        if editing:
+            gender = st.selectbox("Gender", _GENDERS, index=_GENDER_IDX.get(d['gender'], 0),
+                                  key=f"{key_prefix}_gender")
+        else:
+            gender = st.selectbox("Gender *", _GENDERS_WITH_BLANK, key=f"{key_prefix}_gender")
+    
+    with col2:
+        phone = st.text_input(f"Phone Number{required}", value=d['phone'] if editing else "",
+                              placeholder="Enter 10-digit phone number", key=f"{key_prefix}_phone")
+        address = st.text_area(f"Address{required}", value=d['address'] if editing else "",
+                               placeholder="Enter complete address", key=f"{key_prefix}_address")
+    
+    return name, age, gender, phone, address
 
+@st.fragment
 def render_patient_registration():
     """Render patient registration form"""
     st.markdown('<div class="section-header"><h3>🆕 New Patient Registration</h3></div>', 
                 unsafe_allow_html=True)
     
     with st.form("patient_registration_form", clear_on_submit=True):
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            name = st.text_input("Full Name *", placeholder="Enter patient's full name")
-            age = st.number_input("Age *", min_value=0, max_value=150, value=0)
-            gender = st.selectbox("Gender *", ["", "Male", "Female", "Other"])
-        
-        with col2:
-            phone = st.text_input("Phone Number *", placeholder="Enter 10-digit phone number")
-            address = st.text_area("Address *", placeholder="Enter complete address")
+        name, age, gender, phone, address = _patient_fields("register")
         
         submitted = st.form_submit_button("Register Patient", type="primary", use_container_width=True)
         
         if submitted:
-            # Validation
-            errors = []
-            if not name.strip():
-                errors.append("Name is required")
-            if age <= 0:
-                errors.append("Valid age is required")
-            if not gender:
-                errors.append("Gender selection is required")
-            if not phone.strip():
-                errors.append("Phone number is required")
-            elif not validate_phone(phone):
-                errors.append("Please enter a valid 10-digit phone number")
-            if not address.strip():
-                errors.append("Address is required")
+            # Validation - normalise each field once and reuse below
+            n, a, p = name.strip(), address.strip(), normalize_phone(phone)
+            rules = (
+                (not n, "Name is required"),
+                (age <= 0, "Valid age is required"),
+                (not gender, "Gender selection is required"),
+                (not p, "Phone number is required"),
+                (p and not validate_phone(p), "Please enter a valid 10-digit phone number"),
+                (not a, "Address is required"),
+            )
+            errors = [msg for cond, msg in rules if cond]
             
             if errors:
-                for error in errors:
-                    st.error(error)
+                st.error("\n".join(f"- {e}" for e in errors))
                 return
             
             # Check if patient already exists
-            db = PatientDatabase()
-            clean_phone = phone.replace('-', '').replace(' ', '')
+            db = get_db()
             
-            if db.get_patient_by_phone(clean_phone):
+            if db.has_phone(p):
                 st.error("📱 A patient with this phone number is already registered!")
                 return
             
@@ -193,27 +285,33 @@ def render_patient_registration():
             hospital_id = generate_hospital_id()
             patient = Patient(
                 hospital_id=hospital_id,
-                name=name.strip(),
+                name=n,
                 age=age,
                 gender=gender,
-                phone=clean_phone,
-                address=address.strip()
+                phone=p,
+                address=a
             )
             
             if db.save_patient(patient):
-                st.success("✅ Patient registered successfully!")
-                st.markdown(f"""
-                <div class="patient-card">
-                    <h4>📋 Patient Details</h4>
-                    <p><strong>Hospital ID:</strong> {hospital_id}</p>
-                    <p><strong>Name:</strong> {name}</p>
-                    <p><strong>Phone:</strong> {clean_phone}</p>
-                    <p><em>Please save the Hospital ID for future reference</em></p>
-                </div>
-                """, unsafe_allow_html=True)
+                # Full-app rerun refreshes the sidebar stats; the confirmation
+                # is shown from session state on that rerun
+                st.session_state.last_registration = {
+                    'hospital_id': hospital_id,
+                    'name': n,
+                    'phone': p
+                }
+                st.rerun(scope="app")
             else:
                 st.error("❌ Failed to register patient. Please try again.")
+    
+    last_registration = st.session_state.pop('last_registration', None)
+    if last_registration:
+        st.success("✅ Patient registered successfully!")
+        # Escape user-entered values before they reach unsafe_allow_html
+        st.markdown(_CARD_TMPL.format_map({k: html.escape(v) for k, v in last_registration.items()}),
+                    unsafe_allow_html=True)
 
+@st.fragment
 def render_patient_lookup():
     """Render patient lookup and update form"""
     st.markdown('<div class="section-header"><h3>🔍 Patient Information Lookup</h3></div>', 
@@ -224,8 +322,8 @@ def render_patient_lookup():
         col1, col2 = st.columns([3, 1])
         
         with col1:
-            search_type = st.radio("Search by:", ["Phone Number", "Hospital ID"], horizontal=True)
-            if search_type == "Phone Number":
+            search_type = st.radio("Search by:", _SEARCH_MODES, horizontal=True)
+            if search_type == _SEARCH_MODES[0]:
                 search_value = st.text_input("Enter Phone Number", placeholder="Enter 10-digit phone number")
             else:
                 search_value = st.text_input("Enter Hospital ID", placeholder="Enter Hospital ID (e.g., HSP-12345678)")
@@ -233,12 +331,17 @@ def render_patient_lookup():
         with col2:
             search_submitted = st.form_submit_button("🔍 Search", type="primary", use_container_width=True)
     
+    db = get_db()
+    # Popped up front so the confirmation cannot outlive the rerun it was meant for
+    last_update = st.session_state.pop('last_update', None)
+    
     if search_submitted and search_value:
-        db = PatientDatabase()
+        # A new search replaces whichever patient was being edited
+        st.session_state.pop('lookup_hospital_id', None)
         
         # Search for patient
-        if search_type == "Phone Number":
-            clean_search = search_value.replace('-', '').replace(' ', '')
+        if search_type == _SEARCH_MODES[0]:
+            clean_search = normalize_phone(search_value)
             if not validate_phone(clean_search):
                 st.error("Please enter a valid 10-digit phone number")
                 return
@@ -246,121 +349,134 @@ def render_patient_lookup():
         else:
             patient_data = db.get_patient_by_id(search_value.upper())
         
-        if patient_data:
-            st.success("✅ Patient found!")
-            
-            # Update form
-            st.markdown('<div class="section-header"><h4>📝 Update Patient Information</h4></div>', 
-                        unsafe_allow_html=True)
-            
-            with st.form("patient_update_form"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    updated_name = st.text_input("Full Name", value=patient_data['name'])
-                    updated_age = st.number_input("Age", min_value=0, max_value=150, 
-                                                value=patient_data['age'])
-                    updated_gender = st.selectbox("Gender", ["Male", "Female", "Other"], 
-                                                index=["Male", "Female", "Other"].index(patient_data['gender']))
-                
-                with col2:
-                    updated_phone = st.text_input("Phone Number", value=patient_data['phone'])
-                    updated_address = st.text_area("Address", value=patient_data['address'])
-                
-                # Display current info
-                st.info(f"🆔 Hospital ID: **{patient_data['hospital_id']}**")
-                
-                update_submitted = st.form_submit_button("Update Patient Info", type="primary", 
-                                                       use_container_width=True)
-                
-                if update_submitted:
-                    # Validation
-                    errors = []
-                    if not updated_name.strip():
-                        errors.append("Name is required")
-                    if updated_age <= 0:
-                        errors.append("Valid age is required")
-                    if not updated_phone.strip():
-                        errors.append("Phone number is required")
-                    elif not validate_phone(updated_phone):
-                        errors.append("Please enter a valid 10-digit phone number")
-                    if not updated_address.strip():
-                        errors.append("Address is required")
-                    
-                    if errors:
-                        for error in errors:
-                            st.error(error)
-                        return
-                    
-                    # Update patient data
-                    updated_data = {
-                        'name': updated_name.strip(),
-                        'age': updated_age,
-                        'gender': updated_gender,
-                        'phone': updated_phone.replace('-', '').replace(' ', ''),
-                        'address': updated_address.strip()
-                    }
-                    
-                    if db.update_patient(patient_data['phone'], updated_data):
-                        st.success("✅ Patient information updated successfully!")
-                        # Update the phone key if it changed
-                        if updated_data['phone'] != patient_data['phone']:
-                            # Remove old entry and add new one
-                            del st.session_state.patients_db[patient_data['phone']]
-                            updated_data['hospital_id'] = patient_data['hospital_id']
-                            st.session_state.patients_db[updated_data['phone']] = updated_data
-                            st.info("📱 Phone number updated. Please use the new number for future searches.")
-                    else:
-                        st.error("❌ Failed to update patient information. Please try again.")
-        else:
+        if not patient_data:
             st.error("❌ Patient not found!")
             st.info("💡 **Suggestion:** The patient may need to be registered first. Please use the 'New Patient Registration' section.")
+            return
+        
+        st.success("✅ Patient found!")
+        # Remember the match so the update form survives its own submit rerun
+        st.session_state.lookup_hospital_id = patient_data['hospital_id']
+    
+    hospital_id = st.session_state.get('lookup_hospital_id')
+    patient_data = db.get_patient_by_id(hospital_id) if hospital_id else None
+    if not patient_data:
+        return
+    
+    # Update form
+    st.markdown('<div class="section-header"><h4>📝 Update Patient Information</h4></div>', 
+                unsafe_allow_html=True)
+    
+    with st.form("patient_update_form"):
+        # Key on the hospital ID so a new search starts from that patient's values
+        updated_name, updated_age, updated_gender, updated_phone, updated_address = \
+            _patient_fields(f"update_{patient_data['hospital_id']}", patient_data)
+        
+        # Display current info
+        st.info(f"🆔 Hospital ID: **{patient_data['hospital_id']}**")
+        
+        update_submitted = st.form_submit_button("Update Patient Info", type="primary", 
+                                               use_container_width=True)
+        
+        if update_submitted:
+            # Validation - normalise each field once and reuse below
+            n, a, p = updated_name.strip(), updated_address.strip(), normalize_phone(updated_phone)
+            rules = (
+                (not n, "Name is required"),
+                (updated_age <= 0, "Valid age is required"),
+                (not p, "Phone number is required"),
+                (p and not validate_phone(p), "Please enter a valid 10-digit phone number"),
+                (not a, "Address is required"),
+            )
+            errors = [msg for cond, msg in rules if cond]
+            
+            if errors:
+                st.error("\n".join(f"- {e}" for e in errors))
+                return
+            
+            # Update patient data
+            updated_data = {
+                'name': n,
+                'age': updated_age,
+                'gender': updated_gender,
+                'phone': p,
+                'address': a
+            }
+            
+            if p != patient_data['phone'] and db.has_phone(p):
+                st.error("📱 Another patient is already registered with this phone number!")
+                return
+            
+            if db.update_patient(patient_data['phone'], updated_data):
+                # Full-app rerun refreshes the sidebar's recent registrations; the
+                # confirmation is shown from session state on that rerun
+                st.session_state.last_update = {
+                    'phone_changed': updated_data['phone'] != patient_data['phone']
+                }
+                st.rerun(scope="app")
+            else:
+                st.error("❌ Failed to update patient information. Please try again.")
+    
+    if last_update:
+        st.success("✅ Patient information updated successfully!")
+        if last_update['phone_changed']:
+            st.info("📱 Phone number updated. Please use the new number for future searches.")
 
-def render_sidebar():
-    """Render sidebar with app info and statistics"""
-    with st.sidebar:
-        st.markdown("""
+@st.cache_data
+def _sidebar_guide() -> str:
+    """Return the sidebar quick-guide markdown"""
+    return """
         ### 🏥 Hospital Management
         
         **Quick Guide:**
         - **Register** new patients with basic info
         - **Search** by phone or Hospital ID
         - **Update** patient information as needed
-        """)
-        
-        db = PatientDatabase()
-        total_patients = db.get_total_patients()
-        
-        st.markdown(f"""
-        ### 📊 Statistics
-        - **Total Patients:** {total_patients}
-        """)
-        
-        if total_patients > 0:
-            st.markdown("### 📋 Recent Registrations")
-            # Show last 3 registered patients
-            recent_patients = list(st.session_state.patients_db.values())[-3:]
-            for patient in reversed(recent_patients):
-                st.markdown(f"**{patient['name']}**  \n📱 {patient['phone']}")
-        
-        st.markdown("---")
-        st.markdown("*Built with Streamlit*")
+        """
 
-def main():
-    """Main application function"""
-    # Header
-    st.markdown("""
+@st.fragment
+def render_sidebar():
+    """Render sidebar with app info and statistics (call inside st.sidebar)"""
+    st.markdown(_sidebar_guide())
+    
+    db = get_db()
+    total_patients = db.get_total_patients()
+    
+    st.markdown(f"""
+    ### 📊 Statistics
+    - **Total Patients:** {total_patients}
+    """)
+    
+    if total_patients > 0:
+        st.markdown("### 📋 Recent Registrations")
+        # Show last 3 registered patients, newest first
+        for patient in db.get_recent_patients(3):
+            st.markdown(f"**{patient['name']}**  \n📱 {patient['phone']}")
+    
+    st.markdown("---")
+    st.markdown("*Built with Streamlit*")
+
+@st.cache_data
+def _header_html() -> str:
+    """Return the main page header HTML"""
+    return """
     <div class="main-header">
         <h1>🏥 Hospital Patient Management System</h1>
         <p>Streamline patient data entry across departments</p>
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+def main():
+    """Main application function"""
+    # Header
+    st.markdown(_header_html(), unsafe_allow_html=True)
     
-    # Render sidebar
-    render_sidebar()
+    # Render sidebar (fragments must be called inside the sidebar context)
+    with st.sidebar:
+        render_sidebar()
     
     # Main content tabs
-    tab1, tab2 = st.tabs(["👤 Patient Registration", "🔍 Patient Lookup & Update"])
+    tab1, tab2 = st.tabs(_TABS)
     
     with tab1:
         render_patient_registration()